@@ -1,12 +1,20 @@
+import mmap
 import os
+import re
 import sys
 import argparse
 import shutil
 import subprocess
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import fnmatch
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
 EXTENSION_LANGS = {
     '.py': 'python',
     '.ts': 'typescript',
@@ -24,6 +32,14 @@ EXTENSION_LANGS = {
     '.log': 'text',
 }
 
+GLOB_CHARS = frozenset('*?[')
+
+# Files at least this large are streamed rather than read into memory.
+LARGE_FILE_BYTES = 1 << 20
+
+# ioctl request to reflink one file into another (_IOW(0x94, 9, int) in linux/fs.h).
+FICLONE = 0x40049409
+
 def parse_gitignore(gitignore_path):
     """
     Parses a .gitignore file and returns a list of patterns to ignore.
@@ -39,14 +55,95 @@ def parse_gitignore(gitignore_path):
         pass
     return patterns
 
-def should_ignore(path, ignore_patterns):
+def compile_ignore(patterns):
     """
-    Determines if a given file or directory should be ignored based on the ignore patterns.
+    Combines glob patterns into a single compiled regex, or None if there are no patterns.
     """
-    for pattern in ignore_patterns:
-        if fnmatch.fnmatch(path, pattern) or fnmatch.fnmatch(os.path.basename(path), pattern):
-            return True
-    return False
+    if not patterns:
+        return None
+    return re.compile('|'.join(f'(?:{fnmatch.translate(pattern)})' for pattern in patterns))
+
+def partition_ignore(patterns):
+    """
+    Splits patterns into plain names, matched with a set lookup on the basename, a regex
+    of globs matched against the basename, and a regex of patterns containing a slash,
+    matched against the full path. A trailing slash on a plain name marks it directory-only.
+    Returns (literal_names, literal_dirs, name_rx, path_rx).
+    """
+    literal_names = set()
+    literal_dirs = set()
+    name_patterns = []
+    path_patterns = []
+    for pattern in patterns:
+        name = pattern[:-1] if pattern.endswith('/') else pattern
+        if name and '/' not in name and not GLOB_CHARS.intersection(name):
+            if pattern.endswith('/'):
+                literal_dirs.add(name)
+            else:
+                literal_names.add(name)
+        elif '/' in pattern:
+            path_patterns.append(pattern)
+        else:
+            name_patterns.append(pattern)
+    return literal_names, literal_dirs, compile_ignore(name_patterns), compile_ignore(path_patterns)
+
+def should_ignore_name(name, literal_names, name_rx):
+    """
+    Determines if a file or directory basename matches a plain name or a basename glob.
+    """
+    return name in literal_names or (name_rx is not None and name_rx.match(name) is not None)
+
+def should_ignore(path, path_rx):
+    """
+    Determines if a full path matches one of the patterns that contain a slash.
+    """
+    return path_rx is not None and path_rx.match(path) is not None
+
+def write_fenced(src_path, dst_path, language):
+    """
+    Writes the contents of src_path to dst_path wrapped in a Markdown code fence.
+    Large files are copied by the kernel (sendfile) or through an mmap so they are
+    never held in the Python heap.
+    """
+    prefix = f"```{language}\n".encode()
+    suffix = b"\n```"
+    size = os.path.getsize(src_path)
+    if size < LARGE_FILE_BYTES:
+        content = Path(src_path).read_bytes()
+        with open(dst_path, 'wb') as dst:
+            dst.writelines((prefix, content, suffix))
+        return
+
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        dst.write(prefix)
+        if sys.platform.startswith('linux'):
+            # sendfile writes at the descriptor's offset, so drain the buffer first.
+            dst.flush()
+            offset = 0
+            while offset < size:
+                sent = os.sendfile(dst.fileno(), src.fileno(), offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+        else:
+            with mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                dst.write(mapped)
+        dst.write(suffix)
+
+def rewrite_file(old_path, new_path, language):
+    """
+    Writes the fenced .md copy of old_path and removes the original.
+    Returns the log messages for the caller to emit.
+    """
+    try:
+        write_fenced(old_path, new_path, language)
+        os.unlink(old_path)
+    except OSError as e:
+        return [f"Error processing '{old_path}': {e}"]
+    return [
+        f"Renamed: '{old_path}' -> '{new_path}'",
+        f"Modified contents of '{new_path}' to include Markdown code fences.",
+    ]
 
 def rename_and_modify_files_to_md(directory, recursive=False, dry_run=False, log_callback=None, no_gitignore=False, exclude_patterns=None):
     """
@@ -73,12 +170,14 @@ def rename_and_modify_files_to_md(directory, recursive=False, dry_run=False, log
 
     # Add user-provided exclude patterns
     ignore_patterns.extend(exclude_patterns)
+    literal_names, literal_dirs, name_rx, path_rx = partition_ignore(ignore_patterns)
 
     if recursive:
         walker = os.walk(directory)
     else:
         try:
-            files = os.listdir(directory)
+            with os.scandir(directory) as entries:
+                files = [entry.name for entry in entries if entry.is_file()]
         except OSError as e:
             msg = f"Error accessing directory '{directory}': {e}"
             if log_callback:
@@ -88,38 +187,51 @@ def rename_and_modify_files_to_md(directory, recursive=False, dry_run=False, log
             return
         walker = [(directory, [], files)]
 
+    claimed_paths = set()
+    jobs = []
     for root, dirs, files in walker:
-        dirs[:] = [d for d in dirs if not should_ignore(os.path.join(root, d), ignore_patterns)]
+        dirs[:] = [
+            d for d in dirs
+            if d not in literal_dirs
+            and not should_ignore_name(d, literal_names, name_rx)
+            and not (path_rx and should_ignore(os.path.join(root, d), path_rx))
+        ]
 
         for filename in files:
-            file_ext = os.path.splitext(filename)[1].lower()
-            file_path = os.path.join(root, filename)
+            old_path = os.path.join(root, filename)
 
-            if should_ignore(file_path, ignore_patterns):
-                msg = f"Ignoring '{file_path}' due to .gitignore rules."
+            if should_ignore_name(filename, literal_names, name_rx) or should_ignore(old_path, path_rx):
+                msg = f"Ignoring '{old_path}' due to .gitignore rules."
                 if log_callback:
                     log_callback(msg)
                 else:
                     print(msg)
                 continue
 
-            if file_ext in EXTENSION_LANGS:
-                old_path = os.path.join(root, filename)
-                new_filename = os.path.splitext(filename)[0] + '.md'
+            # Same split as os.path.splitext: leading dots do not start an extension.
+            base_name, dot, ext = filename.rpartition('.')
+            if not (dot and base_name.lstrip('.')):
+                continue
+            file_ext = '.' + ext.lower()
+            language = EXTENSION_LANGS.get(file_ext)
+
+            if language:
+                new_filename = base_name + '.md'
                 new_path = os.path.join(root, new_filename)
 
-                if os.path.exists(new_path):
+                # Rewrites run after the walk, so also check the names already claimed.
+                if os.path.exists(new_path) or new_path in claimed_paths:
                     # Disambiguate by appending the original extension (without dot) before .md
-                    base_name = os.path.splitext(filename)[0]
-                    orig_ext = file_ext.lstrip('.')
+                    orig_ext = file_ext[1:]
                     new_filename = f"{base_name}.{orig_ext}.md"
                     new_path = os.path.join(root, new_filename)
                     # If still collides, add numeric suffix
                     counter = 2
-                    while os.path.exists(new_path):
+                    while os.path.exists(new_path) or new_path in claimed_paths:
                         new_filename = f"{base_name}.{orig_ext}.{counter}.md"
                         new_path = os.path.join(root, new_filename)
                         counter += 1
+                claimed_paths.add(new_path)
 
                 if dry_run:
                     msg = f"[Dry Run] Would rename: '{old_path}' -> '{new_path}' and modify contents."
@@ -128,49 +240,53 @@ def rename_and_modify_files_to_md(directory, recursive=False, dry_run=False, log
                     else:
                         print(msg)
                 else:
-                    try:
-                        os.rename(old_path, new_path)
-                        msg = f"Renamed: '{old_path}' -> '{new_path}'"
-                        if log_callback:
-                            log_callback(msg)
-                        else:
-                            print(msg)
-
-                        with open(new_path, 'r', encoding='utf-8') as file:
-                            content = file.read()
-
-                        language = EXTENSION_LANGS[file_ext]
-                        wrapped_content = f"```{language}\n{content}\n```"
-
-                        with open(new_path, 'w', encoding='utf-8') as file:
-                            file.write(wrapped_content)
-
-                        msg = f"Modified contents of '{new_path}' to include Markdown code fences."
-                        if log_callback:
-                            log_callback(msg)
-                        else:
-                            print(msg)
-                    except OSError as e:
-                        msg = f"Error processing '{old_path}': {e}"
-                        if log_callback:
-                            log_callback(msg)
-                        else:
-                            print(msg)
+                    jobs.append((old_path, new_path, language))
+
+    # Each rewrite is independent and dominated by I/O latency, so overlap them.
+    # Workers return their log lines and logging stays on this thread.
+    with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
+        for messages in executor.map(lambda job: rewrite_file(*job), jobs):
+            for msg in messages:
+                if log_callback:
+                    log_callback(msg)
+                else:
+                    print(msg)
+
+def github_clone_url(repo):
+    """
+    Expands GitHub 'owner/repo' shorthand (accepted by gh) into a URL git can clone.
+    """
+    if '://' in repo or repo.startswith('git@') or os.path.exists(repo):
+        return repo
+    return f"https://github.com/{repo}.git"
 
 def clone_github_repo(repo_url, destination, log_callback=None):
     """
-    Clones a GitHub repository to the specified destination using GitHub CLI.
+    Clones a GitHub repository to the specified destination. Only the current tree is
+    needed, so this makes a shallow, blob-less clone with git, falling back to the
+    GitHub CLI when git is not installed.
     """
-    try:
-        subprocess.run(["gh", "--version"], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    shallow_args = ["--depth", "1", "--filter=blob:none", "--single-branch"]
+    if shutil.which("git"):
+        command = ["git", "clone", *shallow_args, github_clone_url(repo_url), destination]
+    elif shutil.which("gh"):
+        command = ["gh", "repo", "clone", repo_url, destination, "--", *shallow_args]
+    else:
+        msg = "Neither git nor the GitHub CLI ('gh') is installed or found in PATH."
+        if log_callback:
+            log_callback(msg)
+        else:
+            print(msg)
+        return False
 
+    try:
         msg = f"Cloning repository '{repo_url}' into '{destination}'..."
         if log_callback:
             log_callback(msg)
         else:
             print(msg)
 
-        subprocess.run(["gh", "repo", "clone", repo_url, destination], check=True)
+        subprocess.run(command, check=True)
 
         msg = f"Successfully cloned '{repo_url}'."
         if log_callback:
@@ -185,20 +301,13 @@ def clone_github_repo(repo_url, destination, log_callback=None):
         else:
             print(msg)
         return False
-    except FileNotFoundError:
-        msg = "GitHub CLI ('gh') is not installed or not found in PATH."
-        if log_callback:
-            log_callback(msg)
-        else:
-            print(msg)
-        return False
 
 def create_ignore_function(exclude_patterns, gitignore_patterns, source_only=False):
     """
     Creates an ignore function for shutil.copytree that filters out excluded patterns.
     If source_only is True, only copies files with extensions in EXTENSION_LANGS.
     """
-    all_patterns = list(exclude_patterns) + list(gitignore_patterns)
+    literal_names, literal_dirs, name_rx, path_rx = partition_ignore(list(exclude_patterns) + list(gitignore_patterns))
 
     def ignore_func(directory, contents):
         ignored = set()
@@ -207,10 +316,10 @@ def create_ignore_function(exclude_patterns, gitignore_patterns, source_only=Fal
             item_is_dir = os.path.isdir(item_path)
             
             # Check exclude patterns
-            for pattern in all_patterns:
-                if fnmatch.fnmatch(item, pattern) or fnmatch.fnmatch(item_path, pattern):
-                    ignored.add(item)
-                    break
+            if item_is_dir and item in literal_dirs:
+                ignored.add(item)
+            elif should_ignore_name(item, literal_names, name_rx) or should_ignore(item_path, path_rx):
+                ignored.add(item)
             
             # If source_only mode, exclude files without supported extensions
             if source_only and item not in ignored and not item_is_dir:
@@ -222,6 +331,31 @@ def create_ignore_function(exclude_patterns, gitignore_patterns, source_only=Fal
 
     return ignore_func
 
+def clone_file(src, dst):
+    """
+    Copy function for shutil.copytree that shares data blocks with the source where the
+    filesystem supports it: a FICLONE reflink (btrfs, xfs), then copy_file_range, and
+    finally a regular copy.
+    """
+    if fcntl is None or not sys.platform.startswith('linux'):
+        return shutil.copy2(src, dst)
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            try:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            except OSError:
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+    except OSError:
+        # Cross-device copies or kernels without copy_file_range.
+        return shutil.copy2(src, dst)
+    shutil.copystat(src, dst)
+    return dst
+
 def create_directory_copy(original_dir, output_dir=None, log_callback=None, exclude_patterns=None, no_gitignore=False, source_only=False):
     """
     Creates a copy of the specified directory. If output_dir is provided, copies to that location.
@@ -257,7 +391,7 @@ def create_directory_copy(original_dir, output_dir=None, log_callback=None, excl
     ignore_func = create_ignore_function(exclude_patterns, gitignore_patterns, source_only)
 
     try:
-        shutil.copytree(original_dir, copy_dir, ignore=ignore_func)
+        shutil.copytree(original_dir, copy_dir, ignore=ignore_func, copy_function=clone_file)
         msg = f"Created a copy of '{original_dir}' at '{copy_dir}'."
         if log_callback:
             log_callback(msg)
@@ -10,8 +10,13 @@ library distinct visual cues for the thoth-a1 deck profile.
 
 from __future__ import annotations
 
+import argparse
 import math
-import textwrap
+import os
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
 from PIL import Image, ImageDraw, ImageFont
@@ -26,6 +31,11 @@ KEYWORD_ZONE = 140
 OUT_DIR = Path("public/images/cards/thoth")
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 
+# Save at a fast zlib level only when oxipng will recompress the batch
+# afterwards; otherwise the level-1 files would be what gets committed.
+OXIPNG = shutil.which("oxipng")
+PNG_COMPRESS_LEVEL = 1 if OXIPNG else 9
+
 
 def load_font(name: str, size: int) -> ImageFont.FreeTypeFont:
     """
@@ -161,33 +171,96 @@ RANK_LABELS = {
 }
 
 
+SLUG_TABLE = str.maketrans({" ": "-", "/": "-", "'": None, ".": None})
+
+
 def slugify(value: str) -> str:
-    return (
-        value.lower()
-        .replace(" ", "-")
-        .replace("/", "-")
-        .replace("'", "")
-        .replace(".", "")
-    )
+    return value.lower().translate(SLUG_TABLE)
+
+
+@lru_cache(maxsize=None)
+def char_width(font, char: str) -> float:
+    """
+    Cached advance width of a single character.
+    """
+
+    return font.getlength(char)
+
+
+@lru_cache(maxsize=None)
+def wrap_lines(text: str, font, max_width: int) -> tuple[str, ...]:
+    """
+    Greedily wrap text to max_width pixels using per-character advances. Cached
+    because many cards share keyword strings.
+    """
+
+    space = char_width(font, " ")
+    lines = []
+    for paragraph in text.splitlines():
+        line, line_width = [], 0.0
+        for word in paragraph.split():
+            word_width = sum(char_width(font, char) for char in word)
+            if line and line_width + space + word_width > max_width:
+                lines.append(" ".join(line))
+                line, line_width = [word], word_width
+            else:
+                line_width += word_width + (space if line else 0)
+                line.append(word)
+        lines.append(" ".join(line))
+    return tuple(lines)
+
+
+@lru_cache(maxsize=None)
+def line_bbox(font, line: str):
+    """
+    Cached font.getbbox(); each call re-shapes the line through FreeType.
+    """
+
+    return font.getbbox(line)
+
+
+@lru_cache(maxsize=None)
+def font_variant(font, size: int):
+    """
+    Cached copy of font at another point size.
+    """
+
+    return font.font_variant(size=size)
+
+
+@lru_cache(maxsize=None)
+def fit_text(text: str, font, max_width: int, max_height: int):
+    """
+    Wrap text to max_width, shrinking the font until the block is no taller
+    than max_height and no line (e.g. a single long word) is wider than
+    max_width. Returns (font, lines, bboxes, total_height).
+    """
+
+    size = getattr(font, "size", 0)
+    while True:
+        lines = wrap_lines(text, font, max_width)
+        bboxes = [line_bbox(font, line) for line in lines]
+        total_height = sum(bbox[3] for bbox in bboxes) + (len(lines) - 1) * 4
+        fits = total_height <= max_height and max(bbox[2] for bbox in bboxes) <= max_width
+        if fits or size <= 10 or not hasattr(font, "font_variant"):
+            return font, lines, bboxes, total_height
+        size -= 2
+        font = font_variant(font, size)
 
 
 def draw_text_block(draw: ImageDraw.ImageDraw, text: str, box, font, fill):
     """
-    Render wrapped text inside the bounding box.
+    Render wrapped text inside the bounding box, reducing the font size if the
+    wrapped lines would spill past its edges.
     """
 
     x0, y0, x1, y1 = box
     width = x1 - x0
-    lines = []
     if not text:
         return
-    for paragraph in text.splitlines():
-        wrapped = textwrap.wrap(paragraph, width=max(1, width // (font.size // 2)))
-        lines.extend(wrapped if wrapped else [""])
-    total_height = sum(font.getbbox(line)[3] for line in lines) + (len(lines) - 1) * 4
+    font, lines, bboxes, total_height = fit_text(text, font, width, y1 - y0)
     current_y = y0 + max(0, (y1 - y0 - total_height) // 2)
-    for line in lines:
-        bbox = font.getbbox(line)
+    for line, bbox in zip(lines, bboxes):
         text_width = bbox[2]
         draw.text(
             (x0 + (width - text_width) / 2, current_y),
@@ -198,40 +271,49 @@ def draw_text_block(draw: ImageDraw.ImageDraw, text: str, box, font, fill):
         current_y += bbox[3] + 4
 
 
-def render_card(filename: Path, title: str, subtitle: str, keyword: str, suit: str):
+def build_template(suit: str) -> Image.Image:
+    """
+    Draw the text-free card background for a suit: arcs, title band and the
+    keyword-zone frame. The geometry depends only on the suit colours.
+    """
+
     base_colour, accent = SUIT_COLOURS[suit]
     image = Image.new("RGB", (WIDTH, HEIGHT), base_colour)
     draw = ImageDraw.Draw(image)
 
-    # Decorative arcs give each suit a recognisable motif.
+    # Decorative arcs give each suit a recognisable motif. Both share the
+    # same radius and horizontal extent; only the centre line differs.
     arc_radius = WIDTH * 0.8
-    draw.arc(
-        [
-            (WIDTH - arc_radius) / 2,
-            HEIGHT * 0.25 - arc_radius / 2,
-            (WIDTH + arc_radius) / 2,
-            HEIGHT * 0.25 + arc_radius / 2,
-        ],
-        start=195,
-        end=-15,
-        width=6,
-        fill=accent,
-    )
-    draw.arc(
-        [
-            (WIDTH - arc_radius) / 2,
-            HEIGHT * 0.7 - arc_radius / 2,
-            (WIDTH + arc_radius) / 2,
-            HEIGHT * 0.7 + arc_radius / 2,
-        ],
-        start=15,
-        end=195,
-        width=6,
-        fill=accent,
-    )
+    left, right = (WIDTH - arc_radius) / 2, (WIDTH + arc_radius) / 2
+    for centre_y, start, end in ((HEIGHT * 0.25, 195, -15), (HEIGHT * 0.7, 15, 195)):
+        draw.arc(
+            [left, centre_y - arc_radius / 2, right, centre_y + arc_radius / 2],
+            start=start,
+            end=end,
+            width=6,
+            fill=accent,
+        )
 
     # Title band
     draw.rectangle([0, 0, WIDTH, TITLE_BAND], fill=accent)
+
+    # Keywords / epithets zone
+    draw.rectangle(
+        [MARGIN, HEIGHT - KEYWORD_ZONE - MARGIN, WIDTH - MARGIN, HEIGHT - MARGIN],
+        outline=accent,
+        width=3,
+    )
+    return image
+
+
+TEMPLATES = {suit: build_template(suit) for suit in SUIT_COLOURS}
+
+
+def render_card(filename: Path, title: str, subtitle: str, keyword: str, suit: str):
+    image = TEMPLATES[suit].copy()
+    draw = ImageDraw.Draw(image)
+
+    # Title
     draw_text_block(
         draw,
         title.upper(),
@@ -249,12 +331,7 @@ def render_card(filename: Path, title: str, subtitle: str, keyword: str, suit: s
         "#fef9c3",
     )
 
-    # Keywords / epithets zone
-    draw.rectangle(
-        [MARGIN, HEIGHT - KEYWORD_ZONE - MARGIN, WIDTH - MARGIN, HEIGHT - MARGIN],
-        outline=accent,
-        width=3,
-    )
+    # Keywords / epithets
     draw_text_block(
         draw,
         keyword,
@@ -268,41 +345,83 @@ def render_card(filename: Path, title: str, subtitle: str, keyword: str, suit: s
         "#e0f2fe",
     )
 
-    image.save(filename, format="PNG", optimize=True)
+    # Write to a temporary file first so an interrupted run never leaves a
+    # truncated PNG behind.
+    tmp_path = filename.with_name(filename.name + ".tmp")
+    image.save(tmp_path, format="PNG", compress_level=PNG_COMPRESS_LEVEL)
+    os.replace(tmp_path, filename)
+
+
+def _render_job(job):
+    render_card(*job)
+
+
+def optimise_pngs(paths):
+    """
+    Recompress the generated PNGs with oxipng when it is installed. It searches
+    filters more effectively than Pillow's optimize=True and runs in parallel.
+    """
+
+    if OXIPNG is None:
+        print(f"oxipng not found; PNGs saved at zlib level {PNG_COMPRESS_LEVEL}")
+        return
+    subprocess.run([OXIPNG, "-o", "2", "-q", "--", *map(str, paths)], check=True)
 
 
 def build_major_cards():
+    """Yield (path, title, subtitle, keyword, suit) jobs for the Major Arcana."""
     for number, (title, subtitle) in THOTH_MAJOR_TITLES.items():
         slug = slugify(title)
         path = OUT_DIR / f"thoth_major_{number:02d}_{slug}.png"
-        render_card(path, title, subtitle, "Major Arcana • Macrocosm", "major")
+        yield path, title, subtitle, "Major Arcana • Macrocosm", "major"
 
 
 def build_minor_cards():
+    """Yield (path, title, subtitle, keyword, suit) jobs for the Minor Arcana."""
     for suit, titles in THOTH_MINOR_TITLES.items():
         suit_alias = SUIT_ALIASES[suit]
+        prefix = f"thoth_{suit_alias.lower()}"
         for rank_value in range(1, 11):
             title = titles[rank_value]
             rank_label = RANK_LABELS[rank_value]
             subtitle = f"{rank_label} of {suit_alias}"
             slug = slugify(f"{rank_label}-{suit_alias}-{title}")
-            path = OUT_DIR / f"thoth_{suit_alias.lower()}_{rank_value:02d}_{slug}.png"
-            render_card(path, title, subtitle, f"{title} • {suit_alias}", suit)
+            path = OUT_DIR / f"{prefix}_{rank_value:02d}_{slug}.png"
+            yield path, title, subtitle, f"{title} • {suit_alias}", suit
         # Courts
         for rank_value, base_rank in zip(range(11, 15), ["Page", "Knight", "Queen", "King"]):
             alias = COURT_ALIASES[base_rank]
             subtitle = f"{alias} of {suit_alias}"
             slug = slugify(f"{alias}-{suit_alias}")
-            path = OUT_DIR / f"thoth_{suit_alias.lower()}_{rank_value:02d}_{slug}.png"
-            render_card(path, alias, subtitle, f"Court of {suit_alias}", suit)
+            path = OUT_DIR / f"{prefix}_{rank_value:02d}_{slug}.png"
+            yield path, alias, subtitle, f"Court of {suit_alias}", suit
+
 
+def _make_jobs() -> list[tuple[Path, str, str, str, str]]:
+    """Build the render jobs for all 78 cards once, in deck order."""
+    return [*build_major_cards(), *build_minor_cards()]
 
-def main():
-    build_major_cards()
-    build_minor_cards()
+
+def main(use_threads: bool = False):
+    # Each card is an independent draw + PNG encode, so spread them across
+    # cores. Fonts are module globals and are reloaded on import by spawned
+    # workers, so no initializer is needed. Threads skip the worker start-up
+    # cost and still overlap the PNG encode, which releases the GIL.
+    jobs = _make_jobs()
+    executor_cls = ThreadPoolExecutor if use_threads else ProcessPoolExecutor
+    with executor_cls(max_workers=os.cpu_count()) as executor:
+        list(executor.map(_render_job, jobs, chunksize=8))
+    optimise_pngs(job[0] for job in jobs)
     total = len(list(OUT_DIR.glob("*.png")))
     print(f"Generated {total} Thoth placeholder cards in {OUT_DIR}")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Generate Thoth placeholder cards")
+    parser.add_argument(
+        "--threads",
+        action="store_true",
+        help="Render with a thread pool instead of worker processes",
+    )
+    args = parser.parse_args()
+    main(use_threads=args.threads)
@@ -11,9 +11,15 @@ improve CLIP vision recognition accuracy.
 from __future__ import annotations
 
 import math
+import os
+import shutil
+import subprocess
 import textwrap
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
+import numpy as np
 from PIL import Image, ImageDraw, ImageFont, ImageFilter
 
 # Canvas configuration
@@ -26,6 +32,12 @@ KEYWORD_ZONE = 160
 OUT_DIR = Path("public/images/cards/thoth")
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 
+# With oxipng available, cards are written at zlib level 1 and recompressed in
+# one parallel pass; otherwise level 6 is most of optimize=True's size win at
+# a fraction of the encode time.
+OXIPNG = shutil.which("oxipng")
+PNG_COMPRESS_LEVEL = 1 if OXIPNG else 6
+
 
 def load_font(name: str, size: int) -> ImageFont.FreeTypeFont:
     """
@@ -186,37 +198,30 @@ SUIT_ELEMENTS = {
 }
 
 
-def slugify(value: str) -> str:
-    return (
-        value.lower()
-        .replace(" ", "-")
-        .replace("/", "-")
-        .replace("'", "")
-        .replace(".", "")
-    )
-
+SLUG_TABLE = str.maketrans({" ": "-", "/": "-", "'": None, ".": None})
 
-def draw_gradient_background(draw: ImageDraw.ImageDraw, width: int, height: int, colors: list):
-    """Draw a vertical gradient using the color list."""
-    num_colors = len(colors)
-    if num_colors < 2:
-        return
 
-    segment_height = height // (num_colors - 1)
+def slugify(value: str) -> str:
+    return value.lower().translate(SLUG_TABLE)
 
-    for i in range(num_colors - 1):
-        r1, g1, b1 = colors[i]
-        r2, g2, b2 = colors[i + 1]
 
-        for y in range(segment_height):
-            progress = y / segment_height
-            r = int(r1 + (r2 - r1) * progress)
-            g = int(g1 + (g2 - g1) * progress)
-            b = int(b1 + (b2 - b1) * progress)
+def build_gradient(width: int, height: int, colors: list) -> Image.Image:
+    """Build an image holding a vertical gradient through the color list."""
+    stops = np.asarray(colors, dtype=np.float64)
+    num_segments = len(stops) - 1
+    column = np.empty((height, 1, 3), dtype=np.uint8)
+    column[:] = stops[-1]
+    if num_segments >= 1:
+        segment_height = height // num_segments
+        progress = (np.arange(segment_height) / segment_height)[:, None, None]
+        for i in range(num_segments):
+            c1, c2 = stops[i], stops[i + 1]
+            # astype truncates like int() did in the old per-scanline loop.
+            column[i * segment_height:(i + 1) * segment_height] = (c1 + (c2 - c1) * progress).astype(np.uint8)
 
-            y_pos = i * segment_height + y
-            if y_pos < height:
-                draw.line([(0, y_pos), (width, y_pos)], fill=(r, g, b))
+    # Every row is a single colour, so stretch a 1px column instead of filling
+    # and copying a full-size buffer.
+    return Image.fromarray(column).resize((width, height), Image.NEAREST)
 
 
 def draw_geometric_motifs(draw: ImageDraw.ImageDraw, width: int, height: int, accent_colors: list, suit: str):
@@ -270,30 +275,126 @@ def draw_geometric_motifs(draw: ImageDraw.ImageDraw, width: int, height: int, ac
             draw.polygon([(x + triangle_size, y + triangle_size), (x, y + triangle_size), (x + triangle_size, y)], outline=accent, width=2)
 
 
-def draw_text_block(draw: ImageDraw.ImageDraw, text: str, box, font, fill):
+@lru_cache(maxsize=4096)
+def line_bbox(font, line: str):
+    """Cached font.getbbox(); titles and keywords repeat across the 78 cards."""
+    return font.getbbox(line)
+
+
+@lru_cache(maxsize=1024)
+def wrap_text(text: str, font, width: int) -> tuple[str, ...]:
+    """Split text into the lines draw_text_block renders, cached per font and width."""
+    lines = []
+    for paragraph in text.splitlines():
+        wrapped = textwrap.wrap(paragraph, width=max(1, width // (font.size // 2)))
+        lines.extend(wrapped if wrapped else [""])
+    return tuple(lines)
+
+
+# Padding around cached label masks so glyph overhang past the bbox isn't clipped
+LABEL_PAD = 16
+
+
+@lru_cache(maxsize=1024)
+def label_mask(font, text: str, frac_x: float) -> Image.Image:
+    """
+    Rasterise a text label once as an L mask, at the sub-pixel x offset it will
+    be drawn at. Keywords, element symbols and subtitles repeat across cards.
+    """
+    right, bottom = line_bbox(font, text)[2:]
+    mask = Image.new("L", (right + 2 * LABEL_PAD, bottom + 2 * LABEL_PAD))
+    ImageDraw.Draw(mask).text((LABEL_PAD + frac_x, LABEL_PAD), text, font=font, fill=255)
+    return mask
+
+
+def draw_label(image: Image.Image, xy, text: str, font, fill):
+    """Equivalent to ImageDraw.text(xy, text) on image, via the cached mask."""
+    frac_x, x = math.modf(xy[0])
+    image.paste(fill, (int(x) - LABEL_PAD, int(xy[1]) - LABEL_PAD), label_mask(font, text, frac_x))
+
+
+def draw_text_block(image: Image.Image, text: str, box, font, fill):
     """Render wrapped text inside the bounding box."""
     x0, y0, x1, y1 = box
     width = x1 - x0
-    lines = []
     if not text:
         return
-    for paragraph in text.splitlines():
-        wrapped = textwrap.wrap(paragraph, width=max(1, width // (font.size // 2)))
-        lines.extend(wrapped if wrapped else [""])
-    total_height = sum(font.getbbox(line)[3] for line in lines) + (len(lines) - 1) * 4
+    lines = wrap_text(text, font, width)
+    total_height = sum(line_bbox(font, line)[3] for line in lines) + (len(lines) - 1) * 4
     current_y = y0 + max(0, (y1 - y0 - total_height) // 2)
     for line in lines:
-        bbox = font.getbbox(line)
+        bbox = line_bbox(font, line)
         text_width = bbox[2]
-        draw.text(
+        draw_label(
+            image,
             (x0 + (width - text_width) / 2, current_y),
             line,
-            font=font,
-            fill=fill,
+            font,
+            fill,
         )
         current_y += bbox[3] + 4
 
 
+def build_motif_layer(accent: tuple) -> Image.Image:
+    """Draw the geometric motifs in a single accent colour onto a transparent RGBA overlay."""
+    layer = Image.new("RGBA", (WIDTH, HEIGHT), (0, 0, 0, 0))
+    draw_geometric_motifs(ImageDraw.Draw(layer), WIDTH, HEIGHT, [accent], None)
+    return layer
+
+
+def _motif_accent(suit: str) -> tuple:
+    """The one accent colour draw_geometric_motifs uses for a suit."""
+    accent_colors = SUIT_COLOURS[suit]["accent"]
+    return accent_colors[1] if len(accent_colors) > 1 else accent_colors[0]
+
+
+# Motif overlays depend only on their accent colour; render each distinct one
+# once at import so forked workers inherit them
+_MOTIFS_BY_ACCENT = {
+    accent: build_motif_layer(accent)
+    for accent in {_motif_accent(suit) for suit in SUIT_COLOURS}
+}
+MOTIF_LAYERS = {suit: _MOTIFS_BY_ACCENT[_motif_accent(suit)] for suit in SUIT_COLOURS}
+
+
+@lru_cache(maxsize=None)
+def build_base_template(suit: str) -> Image.Image:
+    """
+    Render the text-free card for a suit: gradient, geometric motifs, title band
+    and keyword-zone border. Built once per suit and copied for every card.
+    """
+    colors = SUIT_COLOURS[suit]
+    accent_gradient = colors["accent"]
+
+    # Create base image from the gradient
+    image = build_gradient(WIDTH, HEIGHT, colors["base"])
+    draw = ImageDraw.Draw(image)
+
+    # Geometric Art Deco motifs, blitted from the pre-drawn overlay
+    motifs = MOTIF_LAYERS[suit]
+    image.paste(motifs, (0, 0), motifs)
+
+    # Title band with gradient
+    image.paste(build_gradient(WIDTH, TITLE_BAND, accent_gradient), (0, 0))
+
+    # Keywords zone with border
+    keyword_y = HEIGHT - KEYWORD_ZONE - MARGIN
+    draw.rectangle(
+        [MARGIN, keyword_y, WIDTH - MARGIN, HEIGHT - MARGIN],
+        outline=accent_gradient[1],
+        width=4,
+    )
+
+    # Inner glow effect
+    draw.rectangle(
+        [MARGIN + 4, keyword_y + 4, WIDTH - MARGIN - 4, HEIGHT - MARGIN - 4],
+        outline=accent_gradient[0],
+        width=2,
+    )
+
+    return image
+
+
 def render_card(
     filename: Path,
     title: str,
@@ -304,30 +405,14 @@ def render_card(
     astro_symbol: str = None,
 ):
     """Render enhanced Thoth-style card with gradients and symbols."""
-    colors = SUIT_COLOURS[suit]
-    base_gradient = colors["base"]
-    accent_gradient = colors["accent"]
-    glow_color = colors["glow"]
-
-    # Create base image with gradient
-    image = Image.new("RGB", (WIDTH, HEIGHT), base_gradient[0])
-    draw = ImageDraw.Draw(image)
+    glow_color = SUIT_COLOURS[suit]["glow"]
 
-    # Draw gradient background
-    draw_gradient_background(draw, WIDTH, HEIGHT, base_gradient)
-
-    # Draw geometric Art Deco motifs
-    draw_geometric_motifs(draw, WIDTH, HEIGHT, accent_gradient, suit)
-
-    # Title band with gradient
-    title_gradient = Image.new("RGB", (WIDTH, TITLE_BAND), accent_gradient[0])
-    title_draw = ImageDraw.Draw(title_gradient)
-    draw_gradient_background(title_draw, WIDTH, TITLE_BAND, accent_gradient)
-    image.paste(title_gradient, (0, 0))
+    # Every label is pasted from a cached mask rather than re-rasterised
+    image = build_base_template(suit).copy()
 
     # Draw title
     draw_text_block(
-        draw,
+        image,
         title.upper(),
         (MARGIN, 12, WIDTH - MARGIN, TITLE_BAND - 6),
         TITLE_FONT,
@@ -336,50 +421,39 @@ def render_card(
 
     # Hebrew letter (top-left corner) for Major Arcana
     if hebrew_letter:
-        draw.text(
+        draw_label(
+            image,
             (MARGIN - 8, TITLE_BAND + 20),
             hebrew_letter,
-            font=SYMBOL_FONT,
-            fill=glow_color,
+            SYMBOL_FONT,
+            glow_color,
         )
 
     # Astrological symbol (top-right corner)
     if astro_symbol:
-        symbol_bbox = SYMBOL_FONT.getbbox(astro_symbol)
+        symbol_bbox = line_bbox(SYMBOL_FONT, astro_symbol)
         symbol_width = symbol_bbox[2] - symbol_bbox[0]
-        draw.text(
+        draw_label(
+            image,
             (WIDTH - MARGIN - symbol_width + 8, TITLE_BAND + 20),
             astro_symbol,
-            font=SYMBOL_FONT,
-            fill=glow_color,
+            SYMBOL_FONT,
+            glow_color,
         )
 
     # Subtitle
     draw_text_block(
-        draw,
+        image,
         subtitle,
         (MARGIN, TITLE_BAND + 95, WIDTH - MARGIN, TITLE_BAND + 150),
         SUBTITLE_FONT,
         glow_color,
     )
 
-    # Keywords zone with border
+    # Keywords
     keyword_y = HEIGHT - KEYWORD_ZONE - MARGIN
-    draw.rectangle(
-        [MARGIN, keyword_y, WIDTH - MARGIN, HEIGHT - MARGIN],
-        outline=accent_gradient[1],
-        width=4,
-    )
-
-    # Inner glow effect
-    draw.rectangle(
-        [MARGIN + 4, keyword_y + 4, WIDTH - MARGIN - 4, HEIGHT - MARGIN - 4],
-        outline=accent_gradient[0],
-        width=2,
-    )
-
     draw_text_block(
-        draw,
+        image,
         keyword,
         (
             MARGIN + 15,
@@ -394,12 +468,23 @@ def render_card(
     # Add subtle texture overlay for Art Deco feel
     # (optional: could add noise or pattern here)
 
-    image.save(filename, format="PNG", optimize=True)
+    image.save(filename, format="PNG", compress_level=PNG_COMPRESS_LEVEL)
     print(f"Generated: {filename.name}")
 
 
+def optimise_pngs(paths):
+    """Recompress the generated PNGs with oxipng, if it is installed."""
+    if OXIPNG is None:
+        return
+    subprocess.run([OXIPNG, "-o", "2", "-q", "--", *map(str, paths)], check=True)
+
+
+def _render_job(job):
+    render_card(*job)
+
+
 def build_major_cards():
-    """Generate all 22 Major Arcana cards."""
+    """Yield render_card arguments for all 22 Major Arcana cards."""
     for number, (title, subtitle, astro_key) in THOTH_MAJOR_TITLES.items():
         slug = slugify(title)
         path = OUT_DIR / f"thoth_major_{number:02d}_{slug}.png"
@@ -407,19 +492,11 @@ def build_major_cards():
         hebrew = HEBREW_LETTERS.get(number, "")
         astro = ASTRO_SYMBOLS.get(astro_key, "")
 
-        render_card(
-            path,
-            title,
-            subtitle,
-            "Major Arcana • Path of Initiation",
-            "major",
-            hebrew_letter=hebrew,
-            astro_symbol=astro,
-        )
+        yield path, title, subtitle, "Major Arcana • Path of Initiation", "major", hebrew, astro
 
 
 def build_minor_cards():
-    """Generate all 56 Minor Arcana cards."""
+    """Yield render_card arguments for all 56 Minor Arcana cards."""
     for suit, titles in THOTH_MINOR_TITLES.items():
         suit_alias = SUIT_ALIASES[suit]
         element = SUIT_ELEMENTS[suit]
@@ -433,14 +510,7 @@ def build_minor_cards():
             slug = slugify(f"{rank_label}-{suit_alias}-{title}")
             path = OUT_DIR / f"thoth_{suit_alias.lower()}_{rank_value:02d}_{slug}.png"
 
-            render_card(
-                path,
-                title,
-                subtitle,
-                f"{title} • {suit_alias} • {element}",
-                suit,
-                astro_symbol=element_symbol,
-            )
+            yield path, title, subtitle, f"{title} • {suit_alias} • {element}", suit, None, element_symbol
 
         # Court cards (11-14)
         for rank_value, base_rank in zip(range(11, 15), ["Page", "Knight", "Queen", "King"]):
@@ -449,14 +519,7 @@ def build_minor_cards():
             slug = slugify(f"{alias}-{suit_alias}")
             path = OUT_DIR / f"thoth_{suit_alias.lower()}_{rank_value:02d}_{slug}.png"
 
-            render_card(
-                path,
-                alias,
-                subtitle,
-                f"Court of {suit_alias} • {element}",
-                suit,
-                astro_symbol=element_symbol,
-            )
+            yield path, alias, subtitle, f"Court of {suit_alias} • {element}", suit, None, element_symbol
 
 
 def main():
@@ -464,8 +527,12 @@ def main():
     print("Generating enhanced Thoth placeholder cards...")
     print("=" * 60)
 
-    build_major_cards()
-    build_minor_cards()
+    # Cards are independent, so render them across cores. Fonts load on import
+    # and the template caches fill lazily inside each worker.
+    jobs = [*build_major_cards(), *build_minor_cards()]
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        list(executor.map(_render_job, jobs, chunksize=4))
+    optimise_pngs(job[0] for job in jobs)
 
     total = len(list(OUT_DIR.glob("*.png")))
     print("=" * 60)
@@ -8,52 +8,69 @@ Detects card boundaries automatically and extracts each card as a separate file.
 from pathlib import Path
 import cv2
 import numpy as np
-from PIL import Image
+from PIL import Image, ImageOps
 
 INPUT_DIR = Path("public/images")
 OUTPUT_DIR = Path("public/images/thoth-scans")
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
+# Large phone photos are box-filtered down by an integer factor for
+# detection, keeping the short side at or above DETECT_MIN_SIDE; boxes are
+# scaled back up before cropping the full image. Coarser than that, the thin
+# dark gaps around cards blur away and boxes fail the aspect-ratio filter.
+DETECT_MIN_SIDE = 1000
+
 def find_cards_in_image(image_path):
     """
     Detect individual cards in a multi-card photo using contour detection.
     Returns list of bounding boxes (x, y, w, h) for each card.
     """
-    # Read image
-    img = cv2.imread(str(image_path))
-    if img is None:
+    # Read image (Pillow/libjpeg-turbo decode, kept in RGB end to end)
+    try:
+        pil_img = Image.open(image_path)
+        pil_img.load()
+    except OSError:
         print(f"❌ Could not read {image_path}")
-        return []
+        return None, []
+
+    # Upright as shot, like cv2.imread did (Pillow ignores EXIF orientation)
+    pil_img = ImageOps.exif_transpose(pil_img)
 
-    # Convert to grayscale
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    img = np.asarray(pil_img.convert("RGB"))
+
+    # Convert to grayscale (same BT.601 weights as cv2.COLOR_BGR2GRAY) and
+    # box-filter down for detection; contour work is linear in pixel count
+    gray_img = pil_img.convert("L")
+    factor = max(1, min(gray_img.size) // DETECT_MIN_SIDE)
+    gray = np.asarray(gray_img.reduce(factor))
 
     # Apply threshold to get binary image
     _, binary = cv2.threshold(gray, 60, 255, cv2.THRESH_BINARY)
 
     # Find contours
     contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return img, []
 
     # Filter contours by area and aspect ratio (cards should be rectangular)
-    card_boxes = []
-    img_area = img.shape[0] * img.shape[1]
-
-    for contour in contours:
-        x, y, w, h = cv2.boundingRect(contour)
-        area = w * h
-        aspect_ratio = h / w if w > 0 else 0
-
-        # Cards should be:
-        # - Reasonably large (at least 5% of image)
-        # - Vertical rectangles (aspect ratio ~1.5-2.0)
-        # - Not too small or too large
-        if (area > img_area * 0.05 and
-            area < img_area * 0.95 and
-            1.3 < aspect_ratio < 2.2):
-            card_boxes.append((x, y, w, h))
-
-    # Sort by x-coordinate (left to right)
-    card_boxes.sort(key=lambda box: box[0])
+    rects = np.array([cv2.boundingRect(contour) for contour in contours])
+    w, h = rects[:, 2], rects[:, 3]
+    area = w * h
+    aspect_ratio = np.divide(h, w, out=np.zeros(len(rects)), where=w > 0)
+    img_area = gray.shape[0] * gray.shape[1]
+
+    # Cards should be:
+    # - Reasonably large (at least 5% of image)
+    # - Vertical rectangles (aspect ratio ~1.5-2.0)
+    # - Not too small or too large
+    keep = ((area > img_area * 0.05) &
+            (area < img_area * 0.95) &
+            (aspect_ratio > 1.3) & (aspect_ratio < 2.2))
+
+    # Sort by x-coordinate (left to right), in full-resolution coordinates
+    card_rects = rects[keep] * factor
+    card_rects = card_rects[np.argsort(card_rects[:, 0], kind="stable")]
+    card_boxes = [tuple(int(v) for v in rect) for rect in card_rects]
 
     return img, card_boxes
 
@@ -77,11 +94,7 @@ def extract_cards(image_path, output_prefix):
         y2 = min(img.shape[0], y + h + padding)
 
         # Extract card region
-        card_img = img[y1:y2, x1:x2]
-
-        # Convert BGR to RGB for PIL
-        card_rgb = cv2.cvtColor(card_img, cv2.COLOR_BGR2RGB)
-        pil_img = Image.fromarray(card_rgb)
+        pil_img = Image.fromarray(img[y1:y2, x1:x2])
 
         # Save with indexed name
         output_path = OUTPUT_DIR / f"{output_prefix}_card_{i+1:02d}.jpg"
@@ -7,7 +7,9 @@ the width evenly based on the number of cards visible.
 """
 
 from pathlib import Path
-from PIL import Image, ImageOps
+
+import numpy as np
+from PIL import Image
 
 INPUT_DIR = Path("public/images")
 OUTPUT_DIR = Path("public/images/thoth-scans")
@@ -21,14 +23,19 @@ PHOTO_CONFIG = {
     "IMG_0440.JPG": 4,  # The Fool, The High Priestess, Death, Temperance (might be RWS not Thoth)
 }
 
+# Pixels trimmed from each side of a card slice to drop the black border
+BORDER = 10
+
 
 def extract_cards_simple(image_path, num_cards):
     """
     Extract cards by dividing image into equal vertical slices.
     Assumes cards are arranged horizontally in a row with minimal spacing.
     """
-    img = Image.open(image_path)
+    img = Image.open(image_path).convert("RGB")
     width, height = img.size
+    # Decode once; each card below is a zero-copy view into this array
+    arr = np.asarray(img)
 
     # Calculate card width (with small overlap tolerance)
     card_width = width // num_cards
@@ -40,11 +47,11 @@ def extract_cards_simple(image_path, num_cards):
 
     for i in range(num_cards):
         # Calculate crop box for this card
-        # Add small margins to avoid edges
-        left = i * card_width + 5
-        right = (i + 1) * card_width - 5
-        top = 5
-        bottom = height - 5
+        # 5px margin to avoid edges, plus a further 10px to trim black borders
+        left = i * card_width + 5 + BORDER
+        right = (i + 1) * card_width - 5 - BORDER
+        top = 5 + BORDER
+        bottom = height - 5 - BORDER
 
         # Ensure we don't go outside image bounds
         left = max(0, left)
@@ -52,11 +59,7 @@ def extract_cards_simple(image_path, num_cards):
         top = max(0, top)
         bottom = min(height, bottom)
 
-        # Crop card
-        card_img = img.crop((left, top, right, bottom))
-
-        # Auto-crop to remove black borders
-        card_img = ImageOps.crop(card_img, border=10)
+        card_img = Image.fromarray(arr[top:bottom, left:right])
 
         # Save
         output_path = OUTPUT_DIR / f"{prefix}_card_{i+1:02d}.jpg"
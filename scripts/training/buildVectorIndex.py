@@ -2,13 +2,20 @@ import os
 import argparse
 import json
 import torch
+import torch.nn.functional as F
 import faiss
 import numpy as np
 from PIL import Image
+from torch.utils.data import DataLoader, Dataset
 from tqdm import tqdm
 from transformers import CLIPProcessor, CLIPModel
 from peft import PeftModel
 
+try:
+    import orjson
+except ImportError:  # optional: faster --export_json serialization
+    orjson = None
+
 """
 Tarot Vision - Vector Index Builder
 -----------------------------------
@@ -20,6 +27,44 @@ Usage:
     python buildVectorIndex.py --deck rws --adapter_path models/adapters/rws
 """
 
+# Batches between torch.cuda.empty_cache() calls while encoding
+EMPTY_CACHE_EVERY = 256
+
+class CardImageDataset(Dataset):
+    """Decodes and preprocesses card images; runs inside DataLoader workers."""
+
+    def __init__(self, image_dir, image_files, processor):
+        self.image_dir = image_dir
+        self.image_files = image_files
+        self.processor = processor
+
+    def __len__(self):
+        return len(self.image_files)
+
+    def __getitem__(self, idx):
+        img_file = self.image_files[idx]
+        try:
+            image = Image.open(os.path.join(self.image_dir, img_file)).convert("RGB")
+            pixel_values = self.processor(images=image, return_tensors="pt")["pixel_values"][0]
+        except Exception as e:
+            print(f"Error processing {img_file}: {e}")
+            return None
+        return pixel_values, img_file
+
+def collate_images(samples):
+    """Stack the images that decoded successfully; failed ones come back as None."""
+    samples = [sample for sample in samples if sample is not None]
+    if not samples:
+        return None, []
+    pixel_values, image_files = zip(*samples)
+    return torch.stack(pixel_values), list(image_files)
+
+def _ndarray_to_list(obj):
+    """json.dump fallback for the NumPy embeddings in the web export."""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
 def build_index(args):
     device = "cuda" if torch.cuda.is_available() else "cpu"
     print(f"Building vector index for deck: {args.deck} on {device}")
@@ -45,7 +90,11 @@ def build_index(args):
         print(f"Error: Image directory {image_dir} not found.")
         return
 
-    image_files = [f for f in os.listdir(image_dir) if f.endswith(('.jpg', '.jpeg', '.png'))]
+    with os.scandir(image_dir) as entries:
+        image_files = [
+            entry.name for entry in entries
+            if entry.name.lower().endswith(('.jpg', '.jpeg', '.png')) and entry.is_file()
+        ]
     if not image_files:
         print("No images found.")
         return
@@ -56,41 +105,70 @@ def build_index(args):
     metadata = []
 
     # 3. Generate Embeddings
-    with torch.no_grad():
-        for idx, img_file in enumerate(tqdm(image_files)):
-            img_path = os.path.join(image_dir, img_file)
-            try:
-                image = Image.open(img_path).convert("RGB")
-                inputs = processor(images=image, return_tensors="pt").to(device)
+    # Workers decode and preprocess the next batches while the model encodes
+    # the current one; each batch is a single forward pass, with one
+    # device->host copy at the end.
+    # On CUDA the forward runs under fp16 autocast; CLIP inference tolerates it.
+    dataset = CardImageDataset(image_dir, image_files, processor)
+    dataloader = DataLoader(
+        dataset,
+        batch_size=args.batch_size,
+        num_workers=args.num_workers,
+        pin_memory=(device == "cuda"),
+        collate_fn=collate_images,
+    )
+
+    use_fp16 = device == "cuda"
+    with torch.inference_mode(), torch.autocast(device_type="cuda", dtype=torch.float16, enabled=use_fp16):
+        for step, (pixel_values, batch_files) in enumerate(tqdm(dataloader), start=1):
+            if not batch_files:
+                continue
 
+            try:
                 # Get image features
-                image_features = model.get_image_features(**inputs)
-
-                # Normalize features (important for cosine similarity)
-                image_features = image_features / image_features.norm(p=2, dim=-1, keepdim=True)
+                image_features = model.get_image_features(
+                    pixel_values=pixel_values.to(device, non_blocking=True)
+                )
+            except Exception as e:
+                print(f"Error processing batch starting at {batch_files[0]}: {e}")
+                continue
 
-                embeddings.append(image_features.cpu().numpy())
+            # Normalize features (important for cosine similarity) in fp32,
+            # which FAISS requires anyway
+            embeddings.append(F.normalize(image_features.float(), p=2, dim=-1))
 
-                # Store metadata
+            # Store metadata; ids match the row in the FAISS index
+            for img_file in batch_files:
                 card_name = img_file.split('.')[0].replace('_', ' ').replace('-', ' ')
                 metadata.append({
-                    "id": idx,
+                    "id": len(metadata),
                     "filename": img_file,
                     "card_name": card_name
                 })
-            except Exception as e:
-                print(f"Error processing {img_file}: {e}")
+
+            # Drop this batch's activations before the next one is loaded, and
+            # periodically hand cached blocks back on very large decks
+            del pixel_values, image_features
+            if device == "cuda" and step % EMPTY_CACHE_EVERY == 0:
+                torch.cuda.empty_cache()
 
     if not embeddings:
         print("No embeddings generated.")
         return
 
     # 4. Build FAISS Index
-    d = embeddings[0].shape[1] # Dimension of embeddings (512 for CLIP-ViT-B/32)
-    embeddings_np = np.vstack(embeddings).astype('float32')
+    embeddings_np = torch.cat(embeddings).cpu().numpy().astype('float32')
+    d = embeddings_np.shape[1] # Dimension of embeddings (512 for CLIP-ViT-B/32)
 
     # Use Inner Product (IP) index because vectors are normalized -> equivalent to Cosine Similarity
-    index = faiss.IndexFlatIP(d)
+    if args.index_type == "hnsw":
+        # Graph index: sub-linear queries for large deck collections.
+        # efSearch is serialized with the index, so readers get the same recall.
+        index = faiss.IndexHNSWFlat(d, 32, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = 64
+        index.hnsw.efSearch = args.ef_search
+    else:
+        index = faiss.IndexFlatIP(d)
     index.add(embeddings_np)
 
     print(f"Index built with {index.ntotal} vectors.")
@@ -136,11 +214,11 @@ def build_index(args):
 
         cards_data = {}
         for i, meta in enumerate(metadata):
-            # Convert numpy float32 to standard float for JSON
-            vec = embeddings[i].tolist()
+            # Keep the float32 row as an ndarray view; the serializer below
+            # converts it, so no per-card list of Python floats is built here
             # Use canonical name as key
             cards_data[meta["card_name"]] = {
-                "embedding": vec,
+                "embedding": embeddings_np[i],
                 "count": 1 # Single prototype for now
             }
 
@@ -149,14 +227,22 @@ def build_index(args):
         }
 
         os.makedirs(os.path.dirname(export_path), exist_ok=True)
-        with open(export_path, 'w') as f:
-            json.dump(full_export, f)
+        if orjson is not None:
+            with open(export_path, 'wb') as f:
+                f.write(orjson.dumps(full_export, option=orjson.OPT_SERIALIZE_NUMPY))
+        else:
+            with open(export_path, 'w') as f:
+                json.dump(full_export, f, default=_ndarray_to_list)
         print(f"Updated {export_path} with {len(cards_data)} cards for {app_deck_id}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Build FAISS vector index for Tarot cards")
     parser.add_argument("--deck", type=str, required=True, help="Deck name (e.g., rws, thoth)")
     parser.add_argument("--adapter_path", type=str, help="Path to trained LoRA adapter")
+    parser.add_argument("--batch_size", type=int, default=32, help="Images per CLIP forward pass")
+    parser.add_argument("--num_workers", type=int, default=min(4, os.cpu_count() or 1), help="DataLoader worker processes for image decoding")
+    parser.add_argument("--index_type", choices=["flat", "hnsw"], default="flat", help="FAISS index: exact flat search or HNSW graph for large collections")
+    parser.add_argument("--ef_search", type=int, default=16, help="HNSW efSearch stored with the index (only for --index_type hnsw)")
     parser.add_argument("--export_json", type=str, help="Path to export JSON for web app (e.g., data/vision/fine-tuned/prototypes.json)")
 
     args = parser.parse_args()
@@ -3,8 +3,10 @@ import os
 import json
 import torch
 import faiss
+import faiss.contrib.torch_utils  # noqa: F401 - lets GPU indices search CUDA tensors directly
 import numpy as np
-from transformers import CLIPProcessor, CLIPModel
+import torch.nn.functional as F
+from transformers import CLIPProcessor, CLIPModel, CLIPTokenizer
 from peft import PeftModel
 
 """
@@ -15,8 +17,202 @@ to verify that the training and indexing process was successful.
 
 Usage:
     python scripts/training/testIndex.py --deck rws --query "a tarot card of the magician"
+    python scripts/training/testIndex.py --deck rws --queries queries.txt
 """
 
+def load_queries(args):
+    """Return the query strings: one per non-empty line of --queries, else --query."""
+    if not args.queries:
+        return [args.query]
+    with open(args.queries, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+# Map the IVF-PQ copy's inverted lists from disk on demand (shared via the page
+# cache) instead of reading them into process memory; searches never modify the
+# index. FAISS only honours IO_FLAG_MMAP for IVF indices, so the flat and HNSW
+# index.faiss files are read normally.
+IVF_READ_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+
+# Flat indices at least this large are searched through an IVF-PQ copy
+IVFPQ_MIN_VECTORS = 10000
+IVFPQ_FACTORY = "IVF64,PQ16"
+IVFPQ_NPROBE = 8
+
+def ivfpq_if_large(index, index_path):
+    """
+    Swap a large flat index for an IVF-PQ one (sub-linear search). The IVF-PQ
+    index is trained once on the stored vectors and saved next to index_path;
+    it is rebuilt when index_path is newer.
+    """
+    if not isinstance(index, faiss.IndexFlat) or index.ntotal < IVFPQ_MIN_VECTORS:
+        return index
+
+    ivfpq_path = os.path.splitext(index_path)[0] + ".ivfpq.faiss"
+    if os.path.exists(ivfpq_path) and os.path.getmtime(ivfpq_path) >= os.path.getmtime(index_path):
+        ivfpq = faiss.read_index(ivfpq_path, IVF_READ_FLAGS)
+    else:
+        print(f"Building {IVFPQ_FACTORY} index from {index.ntotal} vectors...")
+        vectors = index.reconstruct_n(0, index.ntotal)
+        ivfpq = faiss.index_factory(index.d, IVFPQ_FACTORY, index.metric_type)
+        ivfpq.train(vectors)
+        ivfpq.add(vectors)
+        faiss.write_index(ivfpq, ivfpq_path)
+        print(f"Saved {ivfpq_path}")
+
+    ivfpq.nprobe = IVFPQ_NPROBE
+    return ivfpq
+
+def to_gpu_if_available(index):
+    """Move the index onto GPU 0 when faiss-gpu and a device are present."""
+    if not hasattr(faiss, "StandardGpuResources") or faiss.get_num_gpus() == 0:
+        return index
+    try:
+        res = faiss.StandardGpuResources()
+        gpu_index = faiss.index_cpu_to_gpu(res, 0, index)
+    except RuntimeError as e:
+        # e.g. HNSW indices have no GPU implementation
+        print(f"Searching on CPU; could not move index to GPU: {e}")
+        return index
+    # Keep the resources alive for as long as the index is used
+    gpu_index.referenced_objects = [res]
+    print("Searching on GPU")
+    return gpu_index
+
+MODEL_ID = "openai/clip-vit-base-patch32"
+
+QUERY_CACHE_PROMPTS = "query_cache.json"
+QUERY_CACHE_VECTORS = "query_cache.npy"
+
+def canonical_prompts(metadata):
+    """The bounded set of likely queries: each card, upright and reversed."""
+    prompts = []
+    for card_name in dict.fromkeys(meta["card_name"] for meta in metadata):
+        prompts.append(f"a tarot card of {card_name}")
+        prompts.append(f"a reversed tarot card of {card_name}")
+    return prompts
+
+def save_query_cache(deck_dir, prompts, vectors):
+    np.save(os.path.join(deck_dir, QUERY_CACHE_VECTORS), vectors)
+    with open(os.path.join(deck_dir, QUERY_CACHE_PROMPTS), 'w') as f:
+        json.dump(prompts, f, indent=2)
+
+def load_query_cache(deck_dir, index_path):
+    """
+    Map prompt -> cached text embedding (raw encoder output). Ignored when the
+    index is newer than the cache, since the model has likely been retrained.
+    """
+    prompts_path = os.path.join(deck_dir, QUERY_CACHE_PROMPTS)
+    vectors_path = os.path.join(deck_dir, QUERY_CACHE_VECTORS)
+    if not os.path.exists(prompts_path) or not os.path.exists(vectors_path):
+        return {}
+    if os.path.getmtime(vectors_path) < os.path.getmtime(index_path):
+        print("Query cache is older than the index; ignoring it (rebuild with --prebuild_query_cache).")
+        return {}
+    with open(prompts_path, 'r') as f:
+        prompts = json.load(f)
+    vectors = np.load(vectors_path, mmap_mode='r')
+    return {prompt: np.array(vectors[row]) for row, prompt in enumerate(prompts)}
+
+def load_text_model(args, device):
+    """Load CLIP (with the deck's LoRA adapter merged in, if present) for text encoding."""
+    model = CLIPModel.from_pretrained(MODEL_ID)
+    processor = CLIPProcessor.from_pretrained(MODEL_ID)
+
+    adapter_path = os.path.join("models", "adapters", args.deck)
+    if os.path.exists(adapter_path):
+        print(f"Loading LoRA adapter from {adapter_path}")
+        model = PeftModel.from_pretrained(model, adapter_path)
+        model = model.merge_and_unload()
+    else:
+        print("Warning: Adapter not found, using base model.")
+
+    model.to(device)
+    model.eval()
+
+    # Frozen weights are only read to encode queries; int8 weight-only
+    # quantization halves their memory (after the merge, so adapters are kept)
+    if args.int8:
+        try:
+            from torchao.quantization import quantize_
+        except ImportError:
+            print("Warning: --int8 requires torchao (pip install torchao); using full-precision weights.")
+        else:
+            try:
+                from torchao.quantization import Int8WeightOnlyConfig
+            except ImportError:
+                # torchao < 0.9 only has the (since deprecated) function form
+                from torchao.quantization import int8_weight_only as Int8WeightOnlyConfig
+            quantize_(model, Int8WeightOnlyConfig())
+
+    # Compile after merge_and_unload so the adapters are already folded into
+    # the base weights; only worth it for large --queries batches
+    if args.compile and device == "cuda":
+        model.get_text_features = torch.compile(model.get_text_features)
+
+    return model, processor
+
+def encode_texts(model, processor, texts, device):
+    """Run the CLIP text tower over texts in a single batch."""
+    inputs = processor(text=texts, return_tensors="pt", padding=True).to(device)
+    with torch.no_grad():
+        return model.get_text_features(**inputs)
+
+ONNX_TEXT_ENCODER = "text_encoder.onnx"
+
+class TextTower(torch.nn.Module):
+    """get_text_features as a plain forward(), for ONNX export."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+def export_onnx_text_encoder(model, processor, path):
+    """Export the merged text tower with dynamic batch and sequence axes."""
+    sample = processor(text=["a tarot card of the fool"], return_tensors="pt", padding=True)
+    torch.onnx.export(
+        TextTower(model).cpu().eval(),
+        (sample["input_ids"], sample["attention_mask"]),
+        path,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["text_embeds"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "text_embeds": {0: "batch"},
+        },
+        opset_version=17,
+        dynamo=False,
+    )
+
+def load_onnx_text_encoder(deck_dir, index_path):
+    """
+    An onnxruntime session for the exported text tower, or None to use the
+    PyTorch path (no export, onnxruntime missing, or export older than the index).
+    """
+    path = os.path.join(deck_dir, ONNX_TEXT_ENCODER)
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(index_path):
+        return None
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        return None
+    providers = [
+        provider for provider in ("CUDAExecutionProvider", "CPUExecutionProvider")
+        if provider in ort.get_available_providers()
+    ]
+    print(f"Encoding queries with {path}")
+    return ort.InferenceSession(path, providers=providers)
+
+def encode_texts_onnx(session, tokenizer, texts):
+    inputs = tokenizer(texts, return_tensors="np", padding=True)
+    return session.run(None, {
+        "input_ids": inputs["input_ids"].astype(np.int64),
+        "attention_mask": inputs["attention_mask"].astype(np.int64),
+    })[0]
+
 def test_index(args):
     print(f"Testing index for deck: {args.deck}")
 
@@ -34,52 +230,110 @@ def test_index(args):
 
     print(f"Loaded index with {index.ntotal} vectors.")
 
-    # 2. Load Model (Base + Adapter)
     device = "cuda" if torch.cuda.is_available() else "cpu"
-    model_id = "openai/clip-vit-base-patch32"
-    model = CLIPModel.from_pretrained(model_id)
-    processor = CLIPProcessor.from_pretrained(model_id)
+    deck_dir = os.path.dirname(index_path)
 
-    adapter_path = os.path.join("models", "adapters", args.deck)
-    if os.path.exists(adapter_path):
-        print(f"Loading LoRA adapter from {adapter_path}")
-        model = PeftModel.from_pretrained(model, adapter_path)
-        model = model.merge_and_unload()
-    else:
-        print("Warning: Adapter not found, using base model.")
+    if device == "cuda":
+        # TF32 for the text tower's fp32 matmuls on Ampere and newer GPUs
+        torch.backends.cudnn.benchmark = True
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.backends.cudnn.allow_tf32 = True
+        torch.set_float32_matmul_precision("high")
 
-    model.to(device)
-    model.eval()
+    # 2. Optionally prebuild the prompt table or ONNX text encoder, then exit
+    if args.export_onnx:
+        try:
+            import onnx  # noqa: F401 - torch.onnx.export needs it to serialize the graph
+        except ImportError:
+            print("Error: --export_onnx requires onnx (pip install onnx onnxruntime)")
+            return
+        model, processor = load_text_model(args, "cpu")
+        onnx_path = os.path.join(deck_dir, ONNX_TEXT_ENCODER)
+        export_onnx_text_encoder(model, processor, onnx_path)
+        print(f"Exported text encoder to {onnx_path}")
+        return
 
-    # 3. Encode Query
-    print(f"Query: '{args.query}'")
-    inputs = processor(text=[args.query], return_tensors="pt", padding=True).to(device)
+    if args.prebuild_query_cache:
+        model, processor = load_text_model(args, device)
+        prompts = canonical_prompts(metadata)
+        features = encode_texts(model, processor, prompts, device)
+        save_query_cache(deck_dir, prompts, features.float().cpu().numpy())
+        print(f"Cached embeddings for {len(prompts)} canonical prompts in {deck_dir}")
+        return
 
-    with torch.no_grad():
-        text_features = model.get_text_features(**inputs)
-        # Normalize
-        text_features = text_features / text_features.norm(p=2, dim=-1, keepdim=True)
-        query_vector = text_features.cpu().numpy().astype('float32')
+    index = ivfpq_if_large(index, index_path)
+    index = to_gpu_if_available(index)
+
+    queries = load_queries(args)
+    if not queries:
+        print(f"Error: No queries found in {args.queries}")
+        return
+
+    # 3. Encode Queries: exact matches come from the prebuilt prompt table,
+    # the rest in one encoder batch (FAISS also searches best in batches)
+    cache = load_query_cache(deck_dir, index_path)
+    missing = [query for query in queries if query not in cache]
+    live = {}
+    if missing:
+        session = load_onnx_text_encoder(deck_dir, index_path)
+        if session is not None:
+            tokenizer = CLIPTokenizer.from_pretrained(MODEL_ID)
+            live_features = torch.from_numpy(encode_texts_onnx(session, tokenizer, missing)).to(device)
+        else:
+            model, processor = load_text_model(args, device)
+            live_features = encode_texts(model, processor, missing, device)
+        live = dict(zip(missing, live_features.float()))
+    if len(missing) < len(queries):
+        print(f"{len(queries) - len(missing)} of {len(queries)} queries served from the query cache")
+
+    text_features = torch.stack([
+        live[query] if query in live else torch.from_numpy(cache[query]).to(device)
+        for query in queries
+    ])
+
+    # Inner product over unit vectors == cosine similarity, matching how
+    # buildVectorIndex.py normalized the card embeddings; L2 indices are
+    # searched with the raw features. A GPU index takes the CUDA tensor as is,
+    # with no device->host copy; otherwise normalize in place with FAISS.
+    normalize = index.metric_type == faiss.METRIC_INNER_PRODUCT
+    if hasattr(faiss, "GpuIndex") and isinstance(index, faiss.GpuIndex) and text_features.is_cuda:
+        query_vectors = text_features.float().contiguous()
+        if normalize:
+            query_vectors = F.normalize(query_vectors, p=2, dim=-1)
+    else:
+        query_vectors = text_features.cpu().numpy().astype('float32')
+        if normalize:
+            faiss.normalize_L2(query_vectors)
 
     # 4. Search
     k = 5 # Top 5 results
-    D, I = index.search(query_vector, k)
-
-    print("\n--- Search Results ---")
-    for i in range(k):
-        idx = I[0][i]
-        score = D[0][i]
-        if idx < len(metadata):
-            card_info = metadata[idx]
-            print(f"Rank {i+1}: {card_info['card_name']} (Score: {score:.4f})")
-            print(f"        File: {card_info['filename']}")
-        else:
-            print(f"Rank {i+1}: Unknown Index {idx}")
+    D, I = index.search(query_vectors, k)
+    if torch.is_tensor(D):
+        # Only the k results per query come back to the host
+        D, I = D.cpu().numpy(), I.cpu().numpy()
+
+    for q, query in enumerate(queries):
+        print(f"\nQuery: '{query}'")
+        print("--- Search Results ---")
+        for i in range(k):
+            idx = I[q][i]
+            score = D[q][i]
+            if 0 <= idx < len(metadata):
+                card_info = metadata[idx]
+                print(f"Rank {i+1}: {card_info['card_name']} (Score: {score:.4f})")
+                print(f"        File: {card_info['filename']}")
+            else:
+                print(f"Rank {i+1}: Unknown Index {idx}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Test Tarot Vision Index")
     parser.add_argument("--deck", type=str, default="rws", help="Deck name")
     parser.add_argument("--query", type=str, default="a tarot card of the fool", help="Text query")
+    parser.add_argument("--int8", action="store_true", help="Quantize the merged CLIP weights to int8 with torchao")
+    parser.add_argument("--compile", action="store_true", help="Compile the CLIP text tower with torch.compile (CUDA only)")
+    parser.add_argument("--export_onnx", action="store_true", help="Export the merged text encoder to ONNX next to the index (used automatically with onnxruntime), then exit")
+    parser.add_argument("--prebuild_query_cache", action="store_true", help="Encode canonical card prompts once and save them next to the index, then exit")
+    parser.add_argument("--queries", type=str, help="File with one text query per line, searched as a single batch")
 
     args = parser.parse_args()
     test_index(args)
@@ -1,5 +1,6 @@
 import os
 import argparse
+import importlib.util
 import json
 
 """
@@ -13,10 +14,88 @@ Usage:
     python trainLoRA.py --deck rws --epochs 5 --batch_size 4
 """
 
+def load_rgb_image(image_path):
+    """
+    Decode an image as RGB. Uses torchvision.io (libjpeg-turbo, straight to a
+    uint8 CHW tensor) when torchvision is installed, otherwise PIL.
+    """
+    try:
+        from torchvision.io import ImageReadMode, read_image
+    except ImportError:
+        from PIL import Image
+        return Image.open(image_path).convert("RGB")
+    return read_image(image_path, mode=ImageReadMode.RGB)
+
+def build_image_transforms(image_processor):
+    """
+    CLIP image preprocessing as torchvision.transforms.v2, split in two: the
+    per-image resize + center crop (uint8, sizes differ until cropped) and the
+    per-batch rescale + normalize, which TarotCollate applies to the stacked
+    batch. Returns (None, None) when torchvision is not installed.
+    """
+    try:
+        import torch
+        from torchvision.transforms import v2
+    except ImportError:
+        return None, None
+
+    crop_size = image_processor.crop_size
+    image_transform = v2.Compose([
+        v2.Resize(
+            image_processor.size["shortest_edge"],
+            interpolation=v2.InterpolationMode.BICUBIC,
+            antialias=True
+        ),
+        v2.CenterCrop((crop_size["height"], crop_size["width"])),
+    ])
+    batch_transform = v2.Compose([
+        v2.ToDtype(torch.float32, scale=True),
+        v2.Normalize(mean=image_processor.image_mean, std=image_processor.image_std),
+    ])
+    return image_transform, batch_transform
+
+class TarotCollate:
+    """
+    Stack images (finishing preprocessing of uint8 ones as one batch) and pad
+    captions only to the longest in the batch rather than CLIP's 77 tokens.
+    With pad_multiple set, that length is rounded up to a multiple of it (still
+    at most 77) so a compiled model sees a handful of shapes, not one per batch.
+    """
+
+    def __init__(self, tokenizer, batch_transform, pad_multiple=None):
+        self.tokenizer = tokenizer
+        self.batch_transform = batch_transform
+        self.pad_multiple = pad_multiple
+
+    def __call__(self, samples):
+        import torch
+
+        pixel_values = torch.stack([sample["pixel_values"] for sample in samples])
+        if self.batch_transform is not None and pixel_values.dtype == torch.uint8:
+            pixel_values = self.batch_transform(pixel_values)
+
+        padding = {"padding": "longest"}
+        if self.pad_multiple:
+            longest = max(len(sample["input_ids"]) for sample in samples)
+            bucket = -(-longest // self.pad_multiple) * self.pad_multiple
+            padding = {"padding": "max_length", "max_length": min(bucket, 77)}
+        text = self.tokenizer.pad(
+            [{"input_ids": sample["input_ids"]} for sample in samples],
+            return_tensors="pt",
+            **padding
+        )
+        return {
+            "pixel_values": pixel_values,
+            "input_ids": text["input_ids"],
+            "attention_mask": text["attention_mask"]
+        }
+
 class TarotCardDataset:
-    def __init__(self, image_dir, processor, captions_jsonl=None):
+    def __init__(self, image_dir, processor, captions_jsonl=None, pixel_cache_path=None):
         self.image_dir = image_dir
         self.processor = processor
+        self.pixel_values = None
+        self.image_transform, self.batch_transform = build_image_transforms(processor.image_processor)
         self.samples = self._load_caption_samples(captions_jsonl)
         if not self.samples:
             self.samples = [
@@ -29,6 +108,20 @@ class TarotCardDataset:
             ]
         if not self.samples:
             print(f"Warning: No images found in {image_dir}")
+            return
+
+        # Captions are fixed per sample, so tokenize them all once up front
+        # instead of on every __getitem__ call in every epoch. They stay
+        # unpadded; TarotCollate pads each batch to its longest caption.
+        tokens = processor.tokenizer(
+            [sample["caption"] for sample in self.samples],
+            truncation=True,
+            max_length=77
+        )
+        self.input_ids = tokens["input_ids"]
+
+        if pixel_cache_path:
+            self._load_pixel_cache(pixel_cache_path)
 
     def _caption_from_filename(self, filename):
         clean_name = filename.split('.')[0].replace('_', ' ').replace('-', ' ')
@@ -82,34 +175,118 @@ class TarotCardDataset:
         print(f"Loaded {len(samples)} caption samples from {captions_jsonl} ({skipped} skipped rows)")
         return samples
 
+    def _load_image(self, image_path):
+        """
+        Per-sample part of preprocessing: a uint8 crop when the v2 transforms
+        are available (normalized later, per batch), else fully processed.
+        """
+        image = load_rgb_image(image_path)
+        if self.image_transform is not None:
+            return self.image_transform(image)
+        return self.processor.image_processor(image, return_tensors="pt")["pixel_values"].squeeze(0)
+
+    def _load_pixel_cache(self, cache_path):
+        """
+        Preprocessing is deterministic, so each image is decoded and resized
+        once and the stacked crops are saved to cache_path. They are stored as
+        uint8 (a quarter of the float32 size) and normalized per batch like
+        uncached crops. Later runs memory-map the file; it is rebuilt when the
+        image set or mtimes change.
+        """
+        import torch
+
+        image_paths = sorted({sample["image_path"] for sample in self.samples})
+        mtimes = [os.path.getmtime(path) for path in image_paths]
+        # The two preprocessing paths differ slightly (resampling) and store
+        # different dtypes, so the cache is only reused by the path that wrote it
+        pipeline = "transforms.v2-uint8" if self.image_transform is not None else "clip-processor"
+
+        cache = None
+        if os.path.exists(cache_path):
+            try:
+                cache = torch.load(cache_path, mmap=True, weights_only=True)
+            except Exception as exc:
+                print(f"Warning: Ignoring unreadable pixel cache {cache_path}: {exc}")
+
+        if (
+            not cache
+            or cache.get("image_paths") != image_paths
+            or cache.get("mtimes") != mtimes
+            or cache.get("pipeline") != pipeline
+        ):
+            print(f"Preprocessing {len(image_paths)} images into {cache_path}")
+            cache = {
+                "image_paths": image_paths,
+                "mtimes": mtimes,
+                "pipeline": pipeline,
+                "pixel_values": torch.stack([self._load_image(path) for path in image_paths])
+            }
+            os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+            torch.save(cache, cache_path)
+        else:
+            print(f"Loaded preprocessed images from {cache_path}")
+
+        rows = {path: row for row, path in enumerate(image_paths)}
+        self.pixel_rows = [rows[sample["image_path"]] for sample in self.samples]
+        self.pixel_values = cache["pixel_values"]
+
     def __len__(self):
         return len(self.samples)
 
     def __getitem__(self, idx):
-        from PIL import Image
-
-        sample = self.samples[idx]
-        image = Image.open(sample["image_path"]).convert("RGB")
-
-        processed = self.processor(
-            text=[sample["caption"]],
-            images=image,
-            return_tensors="pt",
-            padding="max_length",
-            truncation=True,
-            max_length=77
-        )
+        if self.pixel_values is not None:
+            pixel_values = self.pixel_values[self.pixel_rows[idx]]
+        else:
+            pixel_values = self._load_image(self.samples[idx]["image_path"])
 
         return {
-            "pixel_values": processed["pixel_values"].squeeze(),
-            "input_ids": processed["input_ids"].squeeze(),
-            "attention_mask": processed["attention_mask"].squeeze()
+            "pixel_values": pixel_values,
+            "input_ids": self.input_ids[idx]
         }
 
+def batch_pixel_values(batch, device, batch_transform=None):
+    """
+    Move a batch's pixel_values to device. uint8 batches (collated without a
+    transform) are rescaled and normalized there, after a 4x smaller copy.
+    """
+    pixel_values = batch["pixel_values"].to(device, non_blocking=True)
+    if batch_transform is not None and not pixel_values.is_floating_point():
+        pixel_values = batch_transform(pixel_values)
+    return pixel_values
+
+def evaluate(lora_model, dataloader, device, autocast_dtype=None, batch_transform=None, merge=True):
+    """
+    Mean contrastive loss over dataloader. With merge=True the LoRA deltas are
+    folded into the base weights, so each layer is a single matmul instead of
+    base + A@B, and unmerged again before returning so training can resume.
+    Pass merge=False for quantized bases, where the round trip is lossy.
+    """
+    import torch
+
+    lora_model.eval()
+    if merge:
+        lora_model.merge_adapter()
+    try:
+        total_loss = 0
+        with torch.inference_mode(), torch.autocast(device_type="cuda", dtype=autocast_dtype, enabled=autocast_dtype is not None):
+            for batch in dataloader:
+                outputs = lora_model(
+                    pixel_values=batch_pixel_values(batch, device, batch_transform),
+                    input_ids=batch["input_ids"].to(device, non_blocking=True),
+                    attention_mask=batch["attention_mask"].to(device, non_blocking=True),
+                    return_loss=True
+                )
+                total_loss += outputs.loss.item()
+    finally:
+        if merge:
+            lora_model.unmerge_adapter()
+        lora_model.train()
+    return total_loss / len(dataloader)
+
 def train(args):
     import torch
     from transformers import CLIPProcessor, CLIPModel
-    from peft import LoraConfig, get_peft_model
+    from peft import LoraConfig, get_peft_model, prepare_model_for_kbit_training
     from torch.utils.data import DataLoader
     from tqdm import tqdm
 
@@ -118,9 +295,39 @@ def train(args):
     device = "cuda" if torch.cuda.is_available() else "cpu"
     print(f"Using device: {device}")
 
+    if device == "cuda":
+        # Images are always 224x224, so autotuning the patch conv pays off;
+        # TF32 speeds up any fp32 matmuls on Ampere and newer GPUs
+        torch.backends.cudnn.benchmark = True
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.backends.cudnn.allow_tf32 = True
+        torch.set_float32_matmul_precision("high")
+
     # 1. Load Base Model
     model_id = "openai/clip-vit-base-patch32"
-    model = CLIPModel.from_pretrained(model_id)
+    quantization_config = None
+    if args.quantize_base != "none":
+        # Check up front; otherwise from_pretrained fails deep inside
+        # transformers' bitsandbytes integration with an opaque error
+        if importlib.util.find_spec("bitsandbytes") is None:
+            print(f"Error: --quantize_base {args.quantize_base} requires bitsandbytes (pip install bitsandbytes)")
+            return
+        if device != "cuda":
+            print(f"Error: --quantize_base {args.quantize_base} requires a CUDA GPU")
+            return
+        # QLoRA-style: frozen base weights in 8/4-bit, adapters in full precision
+        from transformers import BitsAndBytesConfig
+        quantization_config = BitsAndBytesConfig(
+            load_in_8bit=(args.quantize_base == "8bit"),
+            load_in_4bit=(args.quantize_base == "4bit"),
+            bnb_4bit_compute_dtype=torch.bfloat16,
+        )
+
+    if quantization_config is not None:
+        model = CLIPModel.from_pretrained(model_id, quantization_config=quantization_config, device_map={"": 0})
+        model = prepare_model_for_kbit_training(model, use_gradient_checkpointing=False)
+    else:
+        model = CLIPModel.from_pretrained(model_id)
     processor = CLIPProcessor.from_pretrained(model_id)
 
     # 2. Configure LoRA
@@ -136,7 +343,28 @@ def train(args):
 
     lora_model = get_peft_model(model, config)
     lora_model.print_trainable_parameters()
-    lora_model.to(device)
+
+    # Recompute activations in backward instead of storing them, so larger
+    # contrastive batches fit. Enabled on the wrapped CLIPModel after PEFT:
+    # CLIPModel has no get_input_embeddings for enable_input_require_grads,
+    # and non-reentrant checkpointing works without the embeddings needing grad.
+    if args.gradient_checkpointing:
+        lora_model.base_model.model.gradient_checkpointing_enable(gradient_checkpointing_kwargs={"use_reentrant": False})
+    if quantization_config is None:
+        # Quantized weights were placed on the GPU at load time
+        lora_model.to(device)
+
+    # Compiled module for the training forward; lora_model itself is kept
+    # for the optimizer and save_pretrained
+    forward_model = lora_model
+    compiled = args.compile and device == "cuda"
+    if args.compile:
+        if compiled:
+            # CUDA graphs are recorded per input shape; TarotCollate buckets
+            # caption lengths below so only a few graphs are ever recorded
+            forward_model = torch.compile(lora_model, mode="reduce-overhead")
+        else:
+            print("Warning: --compile requires CUDA; running eagerly.")
 
     # 3. Prepare Data
     dataset_path = os.path.join("data", "raw_images", args.deck)
@@ -144,40 +372,89 @@ def train(args):
         print(f"Warning: Dataset path {dataset_path} does not exist. Creating dummy dataset for structure verification.")
         os.makedirs(dataset_path, exist_ok=True)
 
-    dataset = TarotCardDataset(dataset_path, processor, captions_jsonl=args.captions_jsonl)
+    pixel_cache_path = None
+    if not args.no_pixel_cache:
+        pixel_cache_path = os.path.join("data", "cache", f"{args.deck}_pixel_values.pt")
+
+    dataset = TarotCardDataset(
+        dataset_path,
+        processor,
+        captions_jsonl=args.captions_jsonl,
+        pixel_cache_path=pixel_cache_path
+    )
     if len(dataset) == 0:
         print("No data found. Skipping training loop.")
         return
 
-    dataloader = DataLoader(dataset, batch_size=args.batch_size, shuffle=True)
+    # Decode and preprocess in worker processes, into pinned memory so the
+    # host->device copies below can run asynchronously. On CUDA, batches stay
+    # uint8 through the copy and are rescaled/normalized on the GPU instead.
+    gpu_batch_transform = dataset.batch_transform if device == "cuda" else None
+    collate_transform = None if gpu_batch_transform is not None else dataset.batch_transform
+    worker_kwargs = {}
+    if args.num_workers > 0:
+        worker_kwargs = {"persistent_workers": True, "prefetch_factor": 2}
+    dataloader = DataLoader(
+        dataset,
+        batch_size=args.batch_size,
+        shuffle=True,
+        num_workers=args.num_workers,
+        pin_memory=(device == "cuda"),
+        collate_fn=TarotCollate(processor.tokenizer, collate_transform, pad_multiple=8 if compiled else None),
+        **worker_kwargs
+    )
 
     # 4. Training Loop
-    optimizer = torch.optim.AdamW(lora_model.parameters(), lr=5e-5)
+    # Only the LoRA weights train; the fused CUDA kernel updates them all in a
+    # few launches rather than one chain of ops per small adapter tensor
+    trainable_params = [p for p in lora_model.parameters() if p.requires_grad]
+    if device == "cuda":
+        optimizer = torch.optim.AdamW(trainable_params, lr=5e-5, fused=True)
+    else:
+        optimizer = torch.optim.AdamW(trainable_params, lr=5e-5, foreach=True)
     lora_model.train()
 
+    # Mixed precision: the forward runs under autocast while weights and
+    # optimizer state stay fp32. fp16 also needs loss scaling; bf16 does not.
+    precision = args.precision
+    if precision != "fp32" and device != "cuda":
+        print(f"Warning: --precision {precision} requires CUDA; training in fp32.")
+        precision = "fp32"
+    autocast_dtype = {"bf16": torch.bfloat16, "fp16": torch.float16}.get(precision)
+    scaler = torch.amp.GradScaler("cuda", enabled=(precision == "fp16"))
+
     print(f"Starting training for {args.epochs} epochs...")
 
     for epoch in range(args.epochs):
         total_loss = 0
         progress_bar = tqdm(dataloader, desc=f"Epoch {epoch+1}/{args.epochs}")
 
-        for batch in progress_bar:
-            pixel_values = batch["pixel_values"].to(device)
-            input_ids = batch["input_ids"].to(device)
-            attention_mask = batch["attention_mask"].to(device)
-
-            outputs = lora_model(
-                pixel_values=pixel_values,
-                input_ids=input_ids,
-                attention_mask=attention_mask,
-                return_loss=True
-            )
-
+        for step, batch in enumerate(progress_bar, start=1):
+            pixel_values = batch_pixel_values(batch, device, gpu_batch_transform)
+            input_ids = batch["input_ids"].to(device, non_blocking=True)
+            attention_mask = batch["attention_mask"].to(device, non_blocking=True)
+
+            with torch.autocast(device_type="cuda", dtype=autocast_dtype, enabled=autocast_dtype is not None):
+                outputs = forward_model(
+                    pixel_values=pixel_values,
+                    input_ids=input_ids,
+                    attention_mask=attention_mask,
+                    return_loss=True
+                )
+
+            # Accumulate gradients over --grad_accum_steps micro-batches per
+            # optimizer step; the epoch's last step may cover fewer
             loss = outputs.loss
-            loss.backward()
+            scaler.scale(loss / args.grad_accum_steps).backward()
 
-            optimizer.step()
-            optimizer.zero_grad()
+            if step % args.grad_accum_steps == 0 or step == len(dataloader):
+                if args.max_grad_norm > 0:
+                    # Clip the true (unscaled) grads, all adapter tensors in one foreach pass
+                    scaler.unscale_(optimizer)
+                    torch.nn.utils.clip_grad_norm_(trainable_params, args.max_grad_norm, foreach=True)
+                scaler.step(optimizer)
+                scaler.update()
+                optimizer.zero_grad(set_to_none=True)
 
             total_loss += loss.item()
             progress_bar.set_postfix({"loss": loss.item()})
@@ -185,6 +462,13 @@ def train(args):
         avg_loss = total_loss / len(dataloader)
         print(f"Epoch {epoch+1} completed. Average Loss: {avg_loss:.4f}")
 
+        if args.eval_each_epoch:
+            # Same dataloader as training, so this is training-set loss with
+            # dropout off, not a held-out metric. Merging into bnb-quantized
+            # weights would requantize them, so skip it there.
+            train_eval_loss = evaluate(lora_model, dataloader, device, autocast_dtype, gpu_batch_transform, merge=quantization_config is None)
+            print(f"Epoch {epoch+1} training loss (eval mode): {train_eval_loss:.4f}")
+
     # 5. Save Adapter
     output_dir = os.path.join("models", "adapters", args.deck)
     os.makedirs(output_dir, exist_ok=True)
@@ -195,7 +479,16 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Train LoRA adapter for Tarot Vision")
     parser.add_argument("--deck", type=str, default="rws", help="Target deck style (rws, thoth, marseille)")
     parser.add_argument("--epochs", type=int, default=5)
-    parser.add_argument("--batch_size", type=int, default=4)
+    parser.add_argument("--batch_size", type=int, default=32, help="Contrastive batch size; every other sample in the batch is a negative")
+    parser.add_argument("--gradient_checkpointing", action="store_true", help="Trade recompute for activation memory to fit larger batches")
+    parser.add_argument("--quantize_base", choices=["none", "8bit", "4bit"], default="none", help="Load the frozen CLIP weights with bitsandbytes (CUDA only)")
+    parser.add_argument("--grad_accum_steps", type=int, default=1, help="Micro-batches per optimizer step (effective batch = batch_size * steps)")
+    parser.add_argument("--max_grad_norm", type=float, default=0.0, help="Clip the LoRA gradient norm to this value (0 disables clipping)")
+    parser.add_argument("--precision", choices=["fp32", "bf16", "fp16"], default="fp32", help="Mixed-precision mode for the forward pass (CUDA only)")
+    parser.add_argument("--compile", action="store_true", help="Compile the training forward with torch.compile (CUDA only)")
+    parser.add_argument("--eval_each_epoch", action="store_true", help="Report the end-of-epoch training-set loss in eval mode (adapters merged unless --quantize_base)")
+    parser.add_argument("--num_workers", type=int, default=min(8, os.cpu_count() or 1), help="DataLoader worker processes (0 loads in the main process)")
+    parser.add_argument("--no_pixel_cache", action="store_true", help="Preprocess images every epoch instead of caching pixel_values under data/cache/")
     parser.add_argument("--captions_jsonl", type=str, default=None, help="Optional JSONL captions generated by scripts/training/generateRwsCaptionDataset.mjs")
 
     args = parser.parse_args()